@@ -8,7 +8,9 @@ import dotenv from 'dotenv';
 import session from 'express-session';
 import chatRoutes from './routes/chat.js';
 import sdiRoutes from './routes/sdi.js';
-import { initializeMCP } from './lib/mcpClient.js';
+import { getMCPClient, initializeMCP } from './lib/mcpClient.js';
+import { destroyAgents } from './lib/httpAgents.js';
+import { readIntEnv } from './lib/env.js';
 
 // Load environment variables
 dotenv.config();
@@ -50,7 +52,7 @@ app.get('/health', (req, res) => {
 });
 
 // Start server
-app.listen(PORT, async () => {
+const server = app.listen(PORT, async () => {
   console.log('='.repeat(60));
   console.log('EEA ChatBot Service - Node.js with OpenAI + MCP');
   console.log('='.repeat(60));
@@ -68,4 +70,26 @@ app.listen(PORT, async () => {
   await initializeMCP();
 });
 
+// Keep idle connections open longer than typical proxy/load balancer idle timeouts
+server.keepAliveTimeout = 75 * 1000;
+server.headersTimeout = 76 * 1000;
+
+// Graceful shutdown - stop accepting connections, give in-flight streams up to
+// SHUTDOWN_DRAIN_TIMEOUT_MS to finish, then release MCP and pooled connections.
+// Streams still running after the drain timeout are cut off.
+async function shutdown(signal: string) {
+  const drainTimeoutMs = readIntEnv('SHUTDOWN_DRAIN_TIMEOUT_MS', 30 * 1000, 0);
+  console.log(`\n${signal} received, shutting down (drain timeout ${drainTimeoutMs} ms)...`);
+  server.close(async () => {
+    await getMCPClient().disconnect();
+    destroyAgents();
+    process.exit(0);
+  });
+  // Force exit if streams do not finish in time
+  setTimeout(() => process.exit(1), drainTimeoutMs).unref();
+}
+
+process.on('SIGTERM', () => shutdown('SIGTERM'));
+process.on('SIGINT', () => shutdown('SIGINT'));
+
 export default app;
@@ -0,0 +1,21 @@
+/**
+ * Environment helpers
+ */
+
+/**
+ * Read an integer setting, falling back to the default when it is unset, not an
+ * integer, or below the minimum
+ */
+export function readIntEnv(name: string, defaultValue: number, min: number = 1): number {
+  const raw = process.env[name];
+  if (raw === undefined || raw.trim() === '') {
+    return defaultValue;
+  }
+
+  const value = Number(raw);
+  if (!Number.isInteger(value) || value < min) {
+    console.warn(`⚠️  Invalid ${name}="${raw}", using default ${defaultValue}`);
+    return defaultValue;
+  }
+  return value;
+}
@@ -0,0 +1,25 @@
+/**
+ * Shared HTTP(S) agents - keep-alive connection pooling for outbound requests
+ */
+import http from 'http';
+import https from 'https';
+
+// Used for SDI Catalogue calls. The OpenAI SDK keeps its own keep-alive agents.
+// maxSockets is left at Node's default (unlimited); idle pooled sockets are closed
+// after the timeout so a reused connection is not one the server already dropped.
+const agentOptions = {
+  keepAlive: true,
+  maxFreeSockets: 20,
+  timeout: 60 * 1000
+};
+
+export const httpAgent = new http.Agent(agentOptions);
+export const httpsAgent = new https.Agent(agentOptions);
+
+/**
+ * Close pooled sockets on shutdown
+ */
+export function destroyAgents(): void {
+  httpAgent.destroy();
+  httpsAgent.destroy();
+}
@@ -4,6 +4,8 @@
  */
 import { Client } from '@modelcontextprotocol/sdk/client/index.js';
 import { StreamableHTTPClientTransport } from '@modelcontextprotocol/sdk/client/streamableHttp.js';
+import { readIntEnv } from './env.js';
+import { Semaphore } from './semaphore.js';
 
 interface MCPTool {
   name: string;
@@ -24,12 +26,68 @@ interface OpenAITool {
   };
 }
 
+interface CacheEntry {
+  value: string;
+  expiresAt: number;
+}
+
+// Catalogue tools whose results are near-static, with their cache TTL in ms
+const CACHEABLE_TOOLS: Record<string, number> = {
+  get_catalogue_tags: 5 * 60 * 1000,
+  get_catalogue_regions: 5 * 60 * 1000,
+  get_catalogue_sources: 5 * 60 * 1000,
+  list_catalogue_groups: 5 * 60 * 1000,
+  get_site_info: 5 * 60 * 1000,
+  get_record_details: 60 * 60 * 1000
+};
+
+const MAX_CACHE_ENTRIES = 512;
+
+/**
+ * Serialize tool arguments with sorted keys so equivalent calls share a cache key
+ */
+function stableStringify(value: any): string {
+  if (Array.isArray(value)) {
+    return `[${value.map(stableStringify).join(',')}]`;
+  }
+  if (value && typeof value === 'object') {
+    const keys = Object.keys(value).sort();
+    return `{${keys.map(k => `${JSON.stringify(k)}:${stableStringify(value[k])}`).join(',')}}`;
+  }
+  return JSON.stringify(value) ?? 'null';
+}
+
+/**
+ * Trim indentation and repeated spaces from a tool description. Descriptions are sent
+ * as prompt tokens on every request; line breaks are kept so lists stay readable.
+ */
+function compactDescription(description: string): string {
+  return description
+    .split('\n')
+    .map(line => line.replace(/[ \t]+/g, ' ').trim())
+    .join('\n')
+    .replace(/\n{3,}/g, '\n\n')
+    .trim();
+}
+
+/**
+ * Identify a tool call by name and normalized arguments
+ */
+export function toolCallKey(toolName: string, args: Record<string, any>): string {
+  return `${toolName}:${stableStringify(args)}`;
+}
+
 class MCPClientWrapper {
   private client: Client | null = null;
   private transport: StreamableHTTPClientTransport | null = null;
   private mcpBaseUrl: string;
   private availableTools: MCPTool[] = [];
+  private openAITools: OpenAITool[] = [];
+  private toolNames = new Set<string>();
   private initialized: boolean = false;
+  private cache = new Map<string, CacheEntry>();
+  private inFlight = new Map<string, Promise<string>>();
+  private limiter = new Semaphore(readIntEnv('MCP_MAX_CONCURRENCY', 50));
 
   constructor(baseUrl: string = 'http://127.0.0.1:3001') {
     this.mcpBaseUrl = baseUrl;
@@ -76,12 +134,15 @@ class MCPClientWrapper {
       // List available tools
       const toolsResponse = await this.client.listTools();
       this.availableTools = toolsResponse.tools as MCPTool[];
+      this.openAITools = this.buildOpenAITools();
+      this.toolNames = new Set(this.availableTools.map(tool => tool.name));
 
       this.initialized = true;
 
       // Log successful connection
       const toolNames = this.availableTools.map(t => t.name).join(', ');
       console.log(`[MCP Client] ✓ Connected with ${this.availableTools.length} tools: ${toolNames}`);
+      console.log(`[MCP Client] Tool schema size: ${Buffer.byteLength(JSON.stringify(this.openAITools))} bytes`);
 
     } catch (error: any) {
       console.error('[MCP Client] ✗ Failed to connect:', error.message);
@@ -100,14 +161,21 @@ class MCPClientWrapper {
   }
 
   /**
-   * Convert MCP tools to OpenAI function format
+   * Get MCP tools in OpenAI function format (converted once at initialization)
    */
   convertToOpenAIFormat(): OpenAITool[] {
+    return this.openAITools;
+  }
+
+  /**
+   * Convert MCP tools to OpenAI function format
+   */
+  private buildOpenAITools(): OpenAITool[] {
     return this.availableTools.map(tool => ({
       type: 'function' as const,
       function: {
         name: tool.name,
-        description: tool.description || '',
+        description: compactDescription(tool.description || ''),
         parameters: tool.inputSchema || {
           type: 'object',
           properties: {},
@@ -125,14 +193,73 @@ class MCPClientWrapper {
       throw new Error('MCP client not initialized');
     }
 
+    // Reject names the server never advertised without a network round trip
+    if (!this.toolNames.has(toolName)) {
+      return `Unknown tool: ${toolName}`;
+    }
+
+    const ttl = CACHEABLE_TOOLS[toolName];
+    const cacheKey = toolCallKey(toolName, args);
+    if (ttl) {
+      const cached = this.cache.get(cacheKey);
+      if (cached && cached.expiresAt > Date.now()) {
+        return cached.value;
+      }
+    }
+
+    // Only idempotent reads are coalesced - every call to any other tool (e.g. one that
+    // creates a record) must reach the server
+    if (!ttl) {
+      return this.executeTool(this.client, toolName, args, cacheKey, ttl);
+    }
+
+    return this.dispatch(this.client, toolName, args, cacheKey, ttl);
+  }
+
+  /**
+   * Start a cacheable tool call, or join the identical one already on the wire
+   */
+  private dispatch(
+    client: Client,
+    toolName: string,
+    args: Record<string, any>,
+    cacheKey: string,
+    ttl: number
+  ): Promise<string> {
+    const pending = this.inFlight.get(cacheKey);
+    if (pending) {
+      return pending;
+    }
+
+    const request = this.executeTool(client, toolName, args, cacheKey, ttl)
+      .finally(() => this.inFlight.delete(cacheKey));
+    this.inFlight.set(cacheKey, request);
+    return request;
+  }
+
+  /**
+   * Send a tool call to the MCP server and cache successful results of cacheable tools
+   */
+  private async executeTool(
+    client: Client,
+    toolName: string,
+    args: Record<string, any>,
+    cacheKey: string,
+    ttl: number | undefined
+  ): Promise<string> {
     try {
-      const result = await this.client.callTool({
+      const result = await this.limiter.run(() => client.callTool({
         name: toolName,
         arguments: args
-      });
+      }));
 
       // Format the result
       const formattedResult = this.formatToolResult(result);
+
+      // Only successful results are cached, errors are retried on the next call
+      if (ttl && !result.isError) {
+        this.setCached(cacheKey, formattedResult, ttl);
+      }
       return formattedResult;
 
     } catch (error: any) {
@@ -141,27 +268,37 @@ class MCPClientWrapper {
     }
   }
 
+  /**
+   * Store a tool result, evicting the oldest entry when the cache is full
+   */
+  private setCached(key: string, value: string, ttl: number): void {
+    this.cache.delete(key);
+    if (this.cache.size >= MAX_CACHE_ENTRIES) {
+      const oldestKey = this.cache.keys().next().value;
+      if (oldestKey !== undefined) {
+        this.cache.delete(oldestKey);
+      }
+    }
+    this.cache.set(key, { value, expiresAt: Date.now() + ttl });
+  }
+
   /**
    * Format MCP tool result for OpenAI
    */
   private formatToolResult(result: any): string {
-    if (result.isError) {
-      const content = result.content || [];
-      if (content.length > 0 && content[0].text) {
-        return `Error: ${content[0].text}`;
+    // Collect every text block and join once, rather than keeping only the first
+    const parts: string[] = [];
+    for (const item of result.content || []) {
+      if (item.type === 'text' && item.text) {
+        parts.push(item.text);
       }
-      return 'Error: Tool execution failed';
     }
 
-    // Extract text content from MCP response
-    const content = result.content || [];
-    if (content.length > 0) {
-      if (content[0].type === 'text' && content[0].text) {
-        return content[0].text;
-      }
+    if (result.isError) {
+      return parts.length > 0 ? `Error: ${parts.join('\n')}` : 'Error: Tool execution failed';
     }
 
-    return 'No result';
+    return parts.length > 0 ? parts.join('\n') : 'No result';
   }
 
   /**
@@ -186,6 +323,10 @@ class MCPClientWrapper {
     this.initialized = false;
     this.client = null;
     this.transport = null;
+    this.openAITools = [];
+    this.toolNames.clear();
+    this.cache.clear();
+    this.inFlight.clear();
   }
 }
 
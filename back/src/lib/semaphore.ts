@@ -0,0 +1,49 @@
+/**
+ * Semaphore - Bound the number of concurrent async operations
+ */
+export class Semaphore {
+  private available: number;
+  private waiters: Array<() => void> = [];
+
+  constructor(maxConcurrency: number) {
+    if (!Number.isInteger(maxConcurrency) || maxConcurrency < 1) {
+      throw new Error(`Invalid semaphore concurrency: ${maxConcurrency}`);
+    }
+    this.available = maxConcurrency;
+  }
+
+  /**
+   * Wait for a free slot
+   */
+  async acquire(): Promise<void> {
+    if (this.available > 0) {
+      this.available--;
+      return;
+    }
+    await new Promise<void>(resolve => this.waiters.push(resolve));
+  }
+
+  /**
+   * Release a slot, handing it directly to the next waiter if any
+   */
+  release(): void {
+    const next = this.waiters.shift();
+    if (next) {
+      next();
+    } else {
+      this.available++;
+    }
+  }
+
+  /**
+   * Run a function while holding a slot
+   */
+  async run<T>(fn: () => Promise<T>): Promise<T> {
+    await this.acquire();
+    try {
+      return await fn();
+    } finally {
+      this.release();
+    }
+  }
+}
@@ -0,0 +1,85 @@
+/**
+ * Server-Sent Events helpers for the chat stream
+ */
+import { Response } from 'express';
+
+export interface SSEPayload {
+  content: string;
+}
+
+/**
+ * Set SSE headers and flush them so the client starts reading immediately
+ */
+export function openSSE(res: Response): void {
+  res.setHeader('Content-Type', 'text/event-stream; charset=utf-8');
+  res.setHeader('Cache-Control', 'no-cache');
+  res.setHeader('Connection', 'keep-alive');
+  res.setHeader('X-Accel-Buffering', 'no');
+  res.flushHeaders();
+}
+
+/**
+ * Encode a payload as a single SSE frame (terminated by a blank line per the SSE spec)
+ */
+export function encodeSSE(payload: SSEPayload): string {
+  return `data: ${JSON.stringify(payload)}\n\n`;
+}
+
+/**
+ * Write a payload to the response as one SSE frame
+ */
+export function writeSSE(res: Response, payload: SSEPayload): void {
+  res.write(encodeSSE(payload));
+}
+
+/**
+ * Coalesces streamed content deltas into fewer SSE frames.
+ * The first delta is sent immediately to keep time-to-first-token low; later deltas
+ * are buffered and flushed once the buffer reaches maxChars or maxDelayMs has passed.
+ */
+export class SSEContentBuffer {
+  private res: Response;
+  private maxChars: number;
+  private maxDelayMs: number;
+  private buffer = '';
+  private timer: NodeJS.Timeout | null = null;
+  private started = false;
+
+  constructor(res: Response, maxChars: number = 256, maxDelayMs: number = 5) {
+    this.res = res;
+    this.maxChars = maxChars;
+    this.maxDelayMs = maxDelayMs;
+  }
+
+  /**
+   * Queue a content delta for the client
+   */
+  write(content: string): void {
+    if (!this.started) {
+      this.started = true;
+      writeSSE(this.res, { content });
+      return;
+    }
+
+    this.buffer += content;
+    if (this.buffer.length >= this.maxChars) {
+      this.flush();
+    } else if (!this.timer) {
+      this.timer = setTimeout(() => this.flush(), this.maxDelayMs);
+    }
+  }
+
+  /**
+   * Send any buffered content as one frame
+   */
+  flush(): void {
+    if (this.timer) {
+      clearTimeout(this.timer);
+      this.timer = null;
+    }
+    if (this.buffer) {
+      writeSSE(this.res, { content: this.buffer });
+      this.buffer = '';
+    }
+  }
+}
@@ -3,44 +3,62 @@
  */
 import { Router, Request, Response } from 'express';
 import OpenAI from 'openai';
-import { getMCPClient } from '../lib/mcpClient.js';
+import { readIntEnv } from '../lib/env.js';
+import { getMCPClient, toolCallKey } from '../lib/mcpClient.js';
+import { Semaphore } from '../lib/semaphore.js';
+import { openSSE, SSEContentBuffer, writeSSE } from '../lib/sse.js';
 
 const router = Router();
 
+interface StreamedTurn {
+  content: string;
+  toolCalls: OpenAI.Chat.ChatCompletionMessageToolCall[];
+  toolResults: Promise<string>[];
+  loopDetected: boolean;
+}
+
+// Upper bound on tool-call rounds per chat request
+const MAX_TOOL_ROUNDS = 4;
+
+// How many times the same tool call may run in one chat request before it is treated as a loop
+const MAX_REPEATED_TOOL_CALLS = 2;
+
+const REPEATED_TOOL_CALL_RESULT = 'This tool was called repeatedly; stopping to avoid a loop.';
+
+// Shared OpenAI client, created once instead of on every request
+let openaiInstance: OpenAI | null = null;
+
 // Get OpenAI client (lazy initialization)
-function getOpenAI() {
+function getOpenAI(): OpenAI {
   if (!process.env.OPENAI_API_KEY) {
     throw new Error('OPENAI_API_KEY environment variable is not set');
   }
-  return new OpenAI({
-    apiKey: process.env.OPENAI_API_KEY
-  });
+  if (!openaiInstance) {
+    openaiInstance = new OpenAI({
+      apiKey: process.env.OPENAI_API_KEY,
+      // Retries 429/5xx with exponential backoff and jitter, honouring Retry-After
+      maxRetries: readIntEnv('OPENAI_MAX_RETRIES', 3, 0)
+    });
+  }
+  return openaiInstance;
 }
 
-/**
- * POST /chat
- * Handle chat requests with streaming support and MCP tools
- */
-router.post('/', async (req: Request, res: Response) => {
-  try {
-    const { prompt } = req.body;
-
-    if (!prompt || !Array.isArray(prompt)) {
-      return res.status(400).json({ error: 'Invalid request: prompt must be an array of messages' });
-    }
-
-    // Log incoming request
-    const userMessage = prompt[prompt.length - 1]?.content || '';
-    console.log(`\n📨 Chat: "${userMessage.substring(0, 60)}${userMessage.length > 60 ? '...' : ''}"`);
-
+// Cap concurrent OpenAI requests across all chat sessions to avoid rate-limit thrash
+// (lazy so the limit is read after dotenv has loaded)
+let openaiLimiter: Semaphore | null = null;
 
-    // Get MCP client
-    const mcpClient = getMCPClient();
-    const mcpEnabled = mcpClient.isInitialized();
+function getOpenAILimiter(): Semaphore {
+  if (!openaiLimiter) {
+    openaiLimiter = new Semaphore(readIntEnv('OPENAI_MAX_CONCURRENCY', 20));
+  }
+  return openaiLimiter;
+}
 
-    // Add system message with MCP tools context
-    const systemContent = mcpEnabled
-      ? `You are a helpful assistant for the European Environment Agency (EEA) that helps users explore the EEA SDI Catalogue of geospatial metadata.
+// System prompts are static, so build them once instead of per request.
+// An identical prefix on every call also lets OpenAI reuse its prompt cache.
+const MCP_SYSTEM_MESSAGE: OpenAI.Chat.ChatCompletionMessageParam = {
+  role: 'system',
+  content: `You are a helpful assistant for the European Environment Agency (EEA) that helps users explore the EEA SDI Catalogue of geospatial metadata.
 
 IMPORTANT: You have access to catalogue tools. You MUST use these tools to answer user questions:
 
@@ -58,111 +76,237 @@ User: "/record e7967ccf-26f0-4758-8afc-5d1ff5b50577"
 Action: Call get_record_details with uuid="e7967ccf-26f0-4758-8afc-5d1ff5b50577"
 
 After getting tool results, present them in a conversational, helpful way.`
-      : `You are a helpful assistant for the European Environment Agency (EEA) that helps users with their questions.
+};
+
+const DEFAULT_SYSTEM_MESSAGE: OpenAI.Chat.ChatCompletionMessageParam = {
+  role: 'system',
+  content: `You are a helpful assistant for the European Environment Agency (EEA) that helps users with their questions.
 
 Provide clear, concise, and helpful responses. When discussing environmental topics, ensure accuracy and cite relevant information when possible.
 
-Be conversational and friendly while maintaining professionalism.`;
+Be conversational and friendly while maintaining professionalism.`
+};
+
+/**
+ * Shorten text for logging, slicing only when it is too long
+ */
+function truncate(text: string, maxLength: number): string {
+  return text.length <= maxLength ? text : `${text.slice(0, maxLength)}...`;
+}
+
+/**
+ * Decode the model's tool call arguments, returning null if they are not a JSON object
+ */
+function parseToolArguments(rawArguments: string): Record<string, any> | null {
+  try {
+    const args = JSON.parse(rawArguments || '{}');
+    return args && typeof args === 'object' && !Array.isArray(args) ? args : null;
+  } catch {
+    return null;
+  }
+}
+
+/**
+ * Stream a chat completion to the client.
+ * Content deltas are forwarded as they arrive (coalesced into SSE frames by the
+ * output buffer). Tool call deltas are accumulated and each call is sent to MCP
+ * as soon as its arguments are complete, i.e. when the next tool call starts or
+ * the stream ends.
+ */
+async function streamTurn(
+  openai: OpenAI,
+  params: OpenAI.Chat.ChatCompletionCreateParamsStreaming,
+  output: SSEContentBuffer,
+  seenToolCalls: Map<string, number>,
+  signal: AbortSignal
+): Promise<StreamedTurn> {
+  const mcpClient = getMCPClient();
+  const toolCalls: OpenAI.Chat.ChatCompletionMessageToolCall[] = [];
+  const toolResults: Promise<string>[] = [];
+  let content = '';
+  let loopDetected = false;
+
+  const dispatchUpTo = (end: number) => {
+    for (let i = toolResults.length; i < end; i++) {
+      const toolCall = toolCalls[i];
+      const args = parseToolArguments(toolCall.function.arguments);
+      if (!args) {
+        // Report malformed arguments back to the model instead of aborting the stream
+        toolResults.push(Promise.resolve(`Error: invalid JSON arguments for tool ${toolCall.function.name}`));
+        continue;
+      }
+
+      // Short-circuit a call the model keeps repeating instead of running it again
+      const key = toolCallKey(toolCall.function.name, args);
+      const count = (seenToolCalls.get(key) || 0) + 1;
+      seenToolCalls.set(key, count);
+      if (count > MAX_REPEATED_TOOL_CALLS) {
+        loopDetected = true;
+        toolResults.push(Promise.resolve(REPEATED_TOOL_CALL_RESULT));
+        continue;
+      }
+
+      toolResults.push(mcpClient.callTool(toolCall.function.name, args));
+    }
+  };
+
+  await getOpenAILimiter().run(async () => {
+    // Aborting the request ends the stream and frees the slot when the client leaves
+    const stream = await openai.chat.completions.create(params, { signal });
+    for await (const chunk of stream) {
+      const delta = chunk.choices[0]?.delta;
+      if (!delta) continue;
+
+      if (delta.content) {
+        content += delta.content;
+        output.write(delta.content);
+      }
+
+      for (const toolCallDelta of delta.tool_calls ?? []) {
+        // A new index means every earlier tool call has its full arguments
+        dispatchUpTo(toolCallDelta.index);
+
+        const toolCall = toolCalls[toolCallDelta.index] ??= {
+          id: '',
+          type: 'function',
+          function: { name: '', arguments: '' }
+        };
+        if (toolCallDelta.id) toolCall.id = toolCallDelta.id;
+        if (toolCallDelta.function?.name) toolCall.function.name += toolCallDelta.function.name;
+        if (toolCallDelta.function?.arguments) toolCall.function.arguments += toolCallDelta.function.arguments;
+      }
+    }
+  });
+  dispatchUpTo(toolCalls.length);
+
+  return { content, toolCalls, toolResults, loopDetected };
+}
+
+/**
+ * POST /chat
+ * Handle chat requests with streaming support and MCP tools
+ */
+router.post('/', async (req: Request, res: Response) => {
+  const output = new SSEContentBuffer(res);
+
+  // Stop work for clients that disconnect mid-stream. The response's 'close' event is
+  // used because the request's fires as soon as its body has been read.
+  const abortController = new AbortController();
+  res.on('close', () => {
+    if (!res.writableFinished) {
+      abortController.abort();
+    }
+  });
+
+  try {
+    const { prompt } = req.body;
+
+    if (!prompt || !Array.isArray(prompt)) {
+      return res.status(400).json({ error: 'Invalid request: prompt must be an array of messages' });
+    }
 
-    const systemMessage: OpenAI.Chat.ChatCompletionMessageParam = {
-      role: 'system',
-      content: systemContent
-    };
+    // Log incoming request
+    const userMessage = prompt[prompt.length - 1]?.content || '';
+    console.log(`\n📨 Chat: "${truncate(userMessage, 60)}"`);
+
+
+    // Get MCP client
+    const mcpClient = getMCPClient();
+    const mcpEnabled = mcpClient.isInitialized();
 
     // Prepare messages for OpenAI
     let messages: OpenAI.Chat.ChatCompletionMessageParam[] = [
-      systemMessage,
+      mcpEnabled ? MCP_SYSTEM_MESSAGE : DEFAULT_SYSTEM_MESSAGE,
       ...prompt
     ];
 
-    // Set up SSE headers
-    res.setHeader('Content-Type', 'text/event-stream');
-    res.setHeader('Cache-Control', 'no-cache');
-    res.setHeader('Connection', 'keep-alive');
-    res.setHeader('X-Accel-Buffering', 'no');
-
     // Get OpenAI client
     const openai = getOpenAI();
 
-    // Prepare API params
-    const apiParams: OpenAI.Chat.ChatCompletionCreateParams = {
-      model: 'gpt-4o',
-      messages: messages,
-      stream: false
-    };
-
-    // Add MCP tools if available
-    if (mcpEnabled) {
-      const mcpTools = mcpClient.convertToOpenAIFormat();
-      if (mcpTools.length > 0) {
+    // Set up SSE headers
+    openSSE(res);
+
+    const mcpTools = mcpEnabled ? mcpClient.convertToOpenAIFormat() : [];
+    const seenToolCalls = new Map<string, number>();
+    let forceAnswer = false;
+
+    // Each round is streamed, so a direct answer reaches the client immediately and
+    // tool calls start while the model is still generating the rest. Rounds continue
+    // until the model answers without tools, bounded by MAX_TOOL_ROUNDS.
+    for (let round = 0; round <= MAX_TOOL_ROUNDS; round++) {
+      const apiParams: OpenAI.Chat.ChatCompletionCreateParamsStreaming = {
+        model: 'gpt-4o',
+        messages: messages,
+        stream: true
+      };
+
+      // Add MCP tools if available. Out of rounds or looping, the schema is left out
+      // entirely - the model answers with the results it has and no tool tokens are sent
+      if (mcpTools.length > 0 && !forceAnswer && round < MAX_TOOL_ROUNDS) {
         apiParams.tools = mcpTools;
         apiParams.tool_choice = 'auto';
       }
-    }
 
-    // First API call - check if model wants to use tools
-    const response = await openai.chat.completions.create(apiParams);
-    const message = response.choices[0].message;
+      const turn = await streamTurn(openai, apiParams, output, seenToolCalls, abortController.signal);
 
-    // Check if the model wants to call tools
-    if (message.tool_calls && message.tool_calls.length > 0) {
-      const toolNames = message.tool_calls.map(tc => tc.function.name).join(', ');
+      if (turn.toolCalls.length === 0) {
+        if (round === 0) {
+          console.log('💬 Direct response (no tools used)');
+        }
+        break;
+      }
+
+      const toolNames = turn.toolCalls.map(tc => tc.function.name).join(', ');
       console.log(`🔧 Using MCP tools: ${toolNames}`);
 
       // Add assistant message to conversation
-      messages.push(message);
+      messages.push({
+        role: 'assistant',
+        content: turn.content || null,
+        tool_calls: turn.toolCalls
+      });
 
-      // Execute all tool calls
-      for (const toolCall of message.tool_calls) {
-        const functionName = toolCall.function.name;
-        const functionArgs = JSON.parse(toolCall.function.arguments);
+      // Wait for the tool calls already dispatched during streaming
+      const toolResults = await Promise.all(turn.toolResults);
+      if (abortController.signal.aborted) {
+        break;
+      }
 
-        // Call the MCP tool
-        const toolResult = await mcpClient.callTool(functionName, functionArgs);
+      // Text already streamed this round (e.g. "Let me look that up.") must not run
+      // into the next round's answer
+      if (turn.content) {
+        output.write('\n\n');
+      }
 
-        // Add tool result to messages
+      // Add tool results to messages in the original order
+      turn.toolCalls.forEach((toolCall, i) => {
         messages.push({
           role: 'tool',
           tool_call_id: toolCall.id,
-          content: toolResult
+          content: toolResults[i]
         });
-      }
-
-      // Second API call with tool results - stream the response
-      const streamResponse = await openai.chat.completions.create({
-        model: 'gpt-4o',
-        messages: messages,
-        stream: true
       });
 
-      for await (const chunk of streamResponse) {
-        const content = chunk.choices[0]?.delta?.content;
-        if (content) {
-          res.write(`data:${JSON.stringify({ content })}\n`);
-        }
+      if (turn.loopDetected) {
+        console.warn('⚠️  Repeated tool call detected, forcing a final answer');
+        forceAnswer = true;
       }
+    }
 
-    } else {
-      // No tool calls, stream the direct response
-      console.log('💬 Direct response (no tools used)');
-
-      const streamResponse = await openai.chat.completions.create({
-        model: 'gpt-4o',
-        messages: messages,
-        stream: true
-      });
-
-      for await (const chunk of streamResponse) {
-        const content = chunk.choices[0]?.delta?.content;
-        if (content) {
-          res.write(`data:${JSON.stringify({ content })}\n`);
-        }
-      }
+    if (abortController.signal.aborted) {
+      console.log('🔌 Client disconnected, chat stream aborted');
+      return;
     }
 
+    output.flush();
     res.end();
 
   } catch (error: any) {
+    if (abortController.signal.aborted) {
+      console.log('🔌 Client disconnected, chat stream aborted');
+      return;
+    }
+
     console.error('❌ Error in chat:', error.message);
 
     // If headers not sent, send error response
@@ -173,7 +317,8 @@ Be conversational and friendly while maintaining professionalism.`;
       });
     } else {
       // If streaming already started, send error as SSE
-      res.write(`data:${JSON.stringify({ content: `Error: ${error.message}` })}\n`);
+      output.flush();
+      writeSSE(res, { content: `Error: ${error.message}` });
       res.end();
     }
   }
@@ -4,9 +4,13 @@
  */
 import { Router, Request, Response } from 'express';
 import axios from 'axios';
+import { httpAgent, httpsAgent } from '../lib/httpAgents.js';
 
 const router = Router();
 
+// Reuse connections to the SDI Catalogue across the sign-in, site info and user info calls
+const sdiHttp = axios.create({ httpAgent, httpsAgent });
+
 // Extend session type to include SDI properties
 declare module 'express-session' {
   interface SessionData {
@@ -19,6 +23,21 @@ declare module 'express-session' {
   }
 }
 
+/**
+ * Find a cookie value in Set-Cookie response headers
+ */
+function extractCookie(setCookieHeaders: string[] | undefined, cookieName: string): string | undefined {
+  const prefix = `${cookieName}=`;
+  for (const cookie of setCookieHeaders || []) {
+    const start = cookie.indexOf(prefix);
+    if (start !== -1) {
+      const end = cookie.indexOf(';', start);
+      return cookie.slice(start + prefix.length, end === -1 ? undefined : end);
+    }
+  }
+  return undefined;
+}
+
 /**
  * POST /api/sdi/connect
  * Authenticate with SDI Catalogue and store session tokens
@@ -34,7 +53,7 @@ router.post('/connect', async (req: Request, res: Response) => {
 
     // Step 1: Sign in to get GN5 session (GNSESSIONID)
     const signinUrl = `${sdiServer}/api/user/signin`;
-    const signinResponse = await axios.post(
+    const signinResponse = await sdiHttp.post(
       signinUrl,
       { username, password },
       {
@@ -53,36 +72,18 @@ router.post('/connect', async (req: Request, res: Response) => {
     }
 
     // Extract GNSESSIONID cookie
-    let gnSessionId: string | undefined;
-    const setCookieHeaders = signinResponse.headers['set-cookie'];
-    if (setCookieHeaders) {
-      for (const cookie of setCookieHeaders) {
-        if (cookie.includes('GNSESSIONID=')) {
-          gnSessionId = cookie.split('GNSESSIONID=')[1].split(';')[0];
-          break;
-        }
-      }
-    }
+    const gnSessionId = extractCookie(signinResponse.headers['set-cookie'], 'GNSESSIONID');
 
     // Step 2: Get GN4 session (JSESSIONID)
     const siteInfoUrl = `${sdiServer}/srv/api/site/info`;
-    const siteResponse = await axios.get(siteInfoUrl, {
+    const siteResponse = await sdiHttp.get(siteInfoUrl, {
       auth: { username, password },
       headers: { 'Accept': 'application/json' },
       timeout: 10000
     });
 
     // Extract JSESSIONID cookie
-    let jsSessionId: string | undefined;
-    const siteSetCookieHeaders = siteResponse.headers['set-cookie'];
-    if (siteSetCookieHeaders) {
-      for (const cookie of siteSetCookieHeaders) {
-        if (cookie.includes('JSESSIONID=')) {
-          jsSessionId = cookie.split('JSESSIONID=')[1].split(';')[0];
-          break;
-        }
-      }
-    }
+    const jsSessionId = extractCookie(siteResponse.headers['set-cookie'], 'JSESSIONID');
 
     if (!gnSessionId && !jsSessionId) {
       return res.status(500).json({ error: 'Failed to obtain session tokens' });
@@ -94,9 +95,9 @@ router.post('/connect', async (req: Request, res: Response) => {
     if (jsSessionId) cookies['JSESSIONID'] = jsSessionId;
     if (gnSessionId) cookies['GNSESSIONID'] = gnSessionId;
 
-    let userInfo = {};
+    let userInfo: any = {};
     try {
-      const meResponse = await axios.get(meUrl, {
+      const meResponse = await sdiHttp.get(meUrl, {
         auth: { username, password },
         headers: {
           'Accept': 'application/json',
@@ -117,21 +118,25 @@ router.post('/connect', async (req: Request, res: Response) => {
     req.session.sdi_gnsessionid = gnSessionId;
     req.session.sdi_user_info = userInfo;
 
+    // Read the user's name once for logging and the response
+    const name = userInfo?.name || '';
+    const surname = userInfo?.surname || '';
+
     // Log tokens to console
     console.log('='.repeat(60));
     console.log(`SDI Connection Successful for user: ${username}`);
     console.log(`Server: ${sdiServer}`);
     console.log(`JSESSIONID: ${jsSessionId}`);
     console.log(`GNSESSIONID: ${gnSessionId}`);
-    console.log(`User: ${(userInfo as any)?.name || ''} ${(userInfo as any)?.surname || ''}`);
+    console.log(`User: ${name} ${surname}`);
     console.log('='.repeat(60));
 
     return res.json({
       success: true,
       message: 'Connected successfully',
       user: {
-        name: (userInfo as any)?.name || '',
-        surname: (userInfo as any)?.surname || '',
+        name,
+        surname,
         username: username
       },
       server: sdiServer